@@ -1,10 +1,168 @@
-import json
 from collections import defaultdict
+from json import dumps
+from operator import itemgetter
+
+try: # orjson parses large benchmark files several times faster than the standard library
+    from orjson import loads as load_json
+except ImportError:
+    from json import loads as load_json
+try: # ijson streams test cases from the file one at a time instead of building the whole tree in memory
+    import ijson
+    if ijson.backend not in ("yajl2_c", "yajl2_cffi"): # the pure Python backends are many times slower than orjson
+        ijson = None
+except ImportError:
+    ijson = None
+
+
+get_question = itemgetter("question") # pulls the question out of a DROP or SQuAD2.0 QA pair
+get_sentences = itemgetter(1) # pulls the sentence list out of a HotpotQA [SOURCE_NAME, [SENTENCE, ...]] context
+
+
+def stream_source_cases(f, benchmark_name):
+    """
+    Yield the top-level test cases of a benchmark JSON file one at a time.
+
+    Cases are parsed incrementally with ijson where it is installed with a compiled backend, so peak memory stays at the size of a single test case rather than a multiple of the file size. Otherwise, the whole file is parsed up front and its cases are yielded from memory.
+
+    A JSON Lines file (.jsonl), such as the output of preprocess_hotpot, is read one test case per line.
+
+    Args:
+        f: a benchmark JSON or JSON Lines file opened in binary mode
+        benchmark_name: one of "drop", "hotpot", "squad2" to locate the test cases in the JSON structure
+    """
+    if f.name.endswith(".jsonl"):
+        yield from (load_json(line) for line in f)
+        return None
+
+    if ijson is not None:
+        if benchmark_name == "drop":
+            yield from (source_case for _, source_case in ijson.kvitems(f, ""))
+        elif benchmark_name == "hotpot":
+            yield from ijson.items(f, "item")
+        elif benchmark_name == "squad2":
+            yield from ijson.items(f, "data.item")
+        return None
+
+    source = load_json(f.read())
+    if benchmark_name == "drop":
+        yield from source.values()
+    elif benchmark_name == "hotpot":
+        yield from source
+    elif benchmark_name == "squad2":
+        yield from source["data"]
+
+
+def preprocess_hotpot(in_path, out_path):
+    """
+    Convert a HotpotQA JSON file to JSON Lines with the sentences of each context joined in advance.
+
+    Each line is a HotpotQA test case reduced to its "level", "question", "context" and "supporting_facts", where each context holds its joined text as a single sentence. Importing the output with import_benchmark_data streams it line by line and makes the per-context joins free, which saves repeating them when the same file is loaded many times.
+
+    Args:
+        in_path: the location of the HotpotQA JSON file
+        out_path: the location to write the JSON Lines file (ending .jsonl)
+    """
+    with open(in_path, mode="rb") as f, open(out_path, mode="w", encoding="utf-8") as out:
+        for source_case in stream_source_cases(f, "hotpot"):
+            preprocessed_case = {
+                "level": source_case["level"],
+                "question": source_case["question"],
+                "context": [[context[0], [" ".join(context[1])]] for context in source_case["context"]],
+                "supporting_facts": source_case["supporting_facts"]
+            }
+            out.write(dumps(preprocessed_case, ensure_ascii=False) + "\n")
+
+    return None
+
+
+def extract_drop_cases(source, inclusions, clean):
+    """
+    Yield a dict of the requested content types for each DROP test case.
+
+    Args:
+        source: an iterable of DROP test cases (see stream_source_cases)
+        inclusions: a set with any of "contexts", "questions" to specify what to extract
+        clean: a function applied to each passage and question before it is extracted
+    """
+    # DROP has the form:
+    # {ID:{"passage":CONTEXT, "qa_pairs":[{"question": QUESTION1}, {"question": QUESTION2}, ...]}, ...}
+    include_contexts = "contexts" in inclusions
+    include_questions = "questions" in inclusions
+    for source_case in source:
+        source_data = {}
+        if include_contexts:
+            source_data["contexts"] = [clean(source_case["passage"])]
+        if include_questions:
+            source_data["questions"] = list(map(clean, map(get_question, source_case["qa_pairs"])))
+        yield source_data
+
+
+def extract_hotpot_cases(source, inclusions, clean, levels, distractors):
+    """
+    Yield a dict of the requested content types for each HotpotQA test case at one of the given difficulty levels.
+
+    Args:
+        source: an iterable of HotpotQA test cases (see stream_source_cases)
+        inclusions: a set with any of "contexts", "questions" to specify what to extract
+        clean: a function applied to each question before it is extracted
+        levels: a collection with any of "easy", "medium", "hard" to filter by difficulty
+        distractors: a Boolean for whether to include the distractor contexts as well as the supporting ones
+    """
+    # HotpotQA has the form:
+    # [{"level": hard, "question": QUESTION, "context": [[SOURCE_NAME, [SENTENCE, SENTENCE, ...]], ...],
+    #   "supporting_facts": [[SOURCE_NAME, FACT_LOCATION_INDEX], ...]}, ...]
+    include_contexts = "contexts" in inclusions
+    include_questions = "questions" in inclusions
+    for source_case in source:
+        # first filter by specified difficulty level
+        if source_case["level"] not in levels:
+            continue
+        source_data = {}
+        if include_questions:
+            source_data["questions"] = [clean(source_case["question"])]
+        if include_contexts and distractors:
+            source_data["contexts"] = list(map(" ".join, map(get_sentences, source_case["context"])))
+        elif include_contexts:
+            supporting_titles = {context_details[0] for context_details in source_case["supporting_facts"]}
+            source_data["contexts"] = [
+                " ".join(context[1]) for context in source_case["context"] if context[0] in supporting_titles
+            ]
+        yield source_data
+
+
+def extract_squad2_cases(source, inclusions, clean):
+    """
+    Yield a dict of the requested content types for each SQuAD2.0 test case (a paragraph and its questions).
+
+    Args:
+        source: an iterable of SQuAD2.0 title groupings (see stream_source_cases)
+        inclusions: a set with any of "title", "contexts", "questions" to specify what to extract
+        clean: a function applied to each context and question before it is extracted
+    """
+    # SQuAD2.0 has the form:
+    # {"data": [{"paragraphs": [{"qas": [{"question": QUESTION}, ...], "context": CONTEXT}, ...]}, ...]}
+    include_titles = "title" in inclusions
+    include_contexts = "contexts" in inclusions
+    include_questions = "questions" in inclusions
+    for grouping in source:
+        for source_case in grouping["paragraphs"]:
+            source_data = {}
+            if include_titles:
+                source_data["title"] = [grouping["title"]]
+            if include_contexts:
+                source_data["contexts"] = [clean(source_case["context"])]
+            if include_questions:
+                source_data["questions"] = list(map(clean, map(get_question, source_case["qas"])))
+            yield source_data
+
+
+CASE_EXTRACTORS = {"drop": extract_drop_cases, "hotpot": extract_hotpot_cases, "squad2": extract_squad2_cases}
+
 
 def import_benchmark_data(
         filepath, benchmark_name,
         include_keys=["title", "contexts", "questions"], hotpot_levels=["easy", "medium", "hard"],
-        hotpot_distractors=True, return_as="cases"
+        hotpot_distractors=True, return_as="cases", pre_stripped=False
     ):
     """
     Import benchmark data from a JSON file into a list of test cases or a dict of content types.
@@ -12,80 +170,31 @@ def import_benchmark_data(
     The test case return is a list of dicts, where each dict has any of the keys "title", "contexts" and "questions" with lists of titles, contexts and questions per test case. The content type return is a dict with any of "titles", "contexts" and "questions", where each value is a list of all such content across all test cases.
 
     Args:
-        filepath: the location of the benchmark JSON file
+        filepath: the location of the benchmark JSON file (or JSON Lines file from preprocess_hotpot)
         benchmark_name: one of "drop", "hotpot", "squad2" for individualised processing
         include_keys: a list with any of "titles", "contexts", "questions" to specify what to import (default is all)
         hotpot_levels: a list with any of "easy", "medium", "hard" to filter by difficulty (default ["hard"])
         hotpot_distractors: a Boolean for whether to include the distractor contexts with hotpot (default False)
         return_as: one of "cases", "contents" to return either a list of test cases or a dict of content types (default "cases")
+        pre_stripped: a Boolean for whether the benchmark texts are known to have no surrounding whitespace, to skip stripping them (default False)
     """
-    # load the data and initialise the imports
-    with open(filepath, encoding="utf-8") as f:
-        source = json.load(f)
-    cases = []
-    contents = defaultdict(list)
+    # resolve the requested content types and text cleaning once rather than per test case
+    inclusions = frozenset(include_keys)
+    clean = str if pre_stripped else str.strip # str() returns a string unchanged
 
-    if benchmark_name == "drop":
-        # DROP has the form:
-        # {ID:{"passage":CONTEXT, "qa_pairs":[{"question": QUESTION1}, {"question": QUESTION2}, ...]}, ...}
-        for source_case in source.values():
-            # define the data types
-            source_data = {
-                "contexts":[source_case["passage"].strip()],
-                "questions":[qa_pair["question"].strip() for qa_pair in source_case["qa_pairs"]]
-            }
-            # return as specified
-            if return_as == "cases":
-                cases.append({key:source_data[key] for key in include_keys})
-            elif return_as == "contents":
-                for key in include_keys:
-                    contents[key].extend(source_data[key])
-
-    elif benchmark_name == "hotpot":
-        # HotpotQA has the form:
-        # [{"level": hard, "question": QUESTION, "context": [[SOURCE_NAME, [SENTENCE, SENTENCE, ...]], ...],
-        #   "supporting_facts": [[SOURCE_NAME, FACT_LOCATION_INDEX], ...]}, ...]
-        for source_case in source:
-            # first filter by specified difficulty level
-            if source_case["level"] not in hotpot_levels:
-                continue
-            # define the data types
-            questions = [source_case["question"].strip()]
-            if hotpot_distractors:
-                contexts = [" ".join(context[1]) for context in source_case["context"]]
-            else:
-                supporting_titles = [context_details[0] for context_details in source_case["supporting_facts"]]
-                contexts = [
-                    " ".join(context[1]) for context in source_case["context"] if context[0] in supporting_titles
-                ]
-            source_data = {"questions":questions, "contexts":contexts}
-            # return as specified
-            if return_as == "cases":
-                cases.append({key:source_data[key] for key in include_keys})
-            elif return_as == "contents":
-                for key in include_keys:
-                    contents[key].extend(source_data[key])
+    # extract the test cases with the benchmark's own processing and return as specified
+    contents = defaultdict(list)
+    with open(filepath, mode="rb") as f:
+        source = stream_source_cases(f, benchmark_name)
+        extract_cases = CASE_EXTRACTORS[benchmark_name]
+        if benchmark_name == "hotpot": # only HotpotQA has difficulty levels and distractors
+            cases = extract_cases(source, inclusions, clean, hotpot_levels, hotpot_distractors)
+        else:
+            cases = extract_cases(source, inclusions, clean)
+        if return_as == "cases":
+            return list(cases)
+        for source_data in cases: # add each case straight to the contents without keeping the cases
+            for key, content in source_data.items():
+                contents[key].extend(content)
 
-    elif benchmark_name == "squad2":
-        # SQuAD2.0 has the form:
-        # {"data": [{"paragraphs": [{"qas": [{"question": QUESTION}, ...], "context": CONTEXT}, ...]}, ...]}
-        source = source["data"]
-        for grouping in source:
-            for source_case in grouping["paragraphs"]:
-                # define the data types
-                source_data = {
-                    "title":[grouping["title"]],
-                    "contexts":[source_case["context"].strip()],
-                    "questions":[qa_pair["question"].strip() for qa_pair in source_case["qas"]]
-                }
-                # return as specified
-                if return_as == "cases":
-                    cases.append({key:source_data[key] for key in include_keys})
-                elif return_as == "contents":
-                    for key in include_keys:
-                        contents[key].extend(source_data[key])
-    
-    if return_as == "cases":
-        return cases
-    
     return contents
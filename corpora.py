@@ -1,89 +1,360 @@
 import csv
+import io
+import logging
 import os
+import pickle
 import re
+import sys
+from array import array
+from bisect import bisect_right
 from collections import Counter
+from heapq import nlargest
 from datetime import date
+from glob import escape, glob
+from itertools import accumulate, groupby
+from operator import itemgetter
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 from nltk.tokenize import sent_tokenize
 
 CACHE_SIZE = 1 # number of compiled corpora to keep in memory
 DATA_FOLDER = "data" # folder with TSV files containing source texts, coref-resolved texts and complexity scores
+CORPUS_CACHE_FOLDER = os.path.join(DATA_FOLDER, ".cache") # folder to save compiled corpora in between app restarts
+CORPUS_CACHE_VERSION = 6 # increase whenever the output of compile_corpus changes, so old saved corpora are ignored
+# versions that a saved corpus can only be loaded under, as it pickles pandas and numpy objects
+CORPUS_CACHE_LIBRARIES = f"py{sys.version_info.major}.{sys.version_info.minor}_pd{pd.__version__}_np{np.__version__}"
+SEARCH_CACHE_SIZE = 32 # number of search results to keep in memory
+QUERY_CACHE_SIZE = 64 # number of compiled search terms to keep in memory
+SOURCE_LIST_TTL = 60 # seconds before DATA_FOLDER is checked again for new or removed sources
 MAX_RETURNS = 1000 # maximum number of examples to show in the main results table and allow for download
+MAX_VOCAB = 1000 # maximum number of words to show in the corpus vocab table
+MAX_STATS = 1000 # maximum number of distinct matches to show in each search stats table
+WILDCARD = r"""[\w",'\-<+“”.\\/:]""" # RegEx for what a * can match: word characters and common in-word punctuation
+PROHIBITED_CHARACTERS = re.compile(r'[\\\(\)\[\]\?\$\+]') # characters that are not allowed in a search term
+PUNCTUATION = re.compile(r'[,;!/:\(\)\.\?"\[\]]') # punctuation to strip from texts to enable accurate vocab count
+LOWERCASE_FIXES = str.maketrans({"İ": "i"}) # characters to lowercase to one character, as re.IGNORECASE matches them
+HIGHLIGHT = r'<font color="red"><b>\g<0></b></font>' # replacement template to style each match in the results
 
-@st.cache_data(max_entries=CACHE_SIZE)
+logger = logging.getLogger(__name__)
+
+@st.cache_resource(max_entries=CACHE_SIZE)
 def compile_corpus(source, resolved_texts=False):
     """
     Compile corpus data from a TSV source containing original texts, coref-resolved texts and complexity scores.
 
-    The source is chosen by the user in Search Parameters. User options are derived from filenames.
+    The source is chosen by the user in Search Parameters. User options are derived from filenames. The corpus is held
+    as a single string of all texts joined by newlines, with the offsets at which each entry starts (plus a final offset
+    one past the end), so that a query can be run over the whole corpus in a single scan and entries are only sliced
+    out of it when they are displayed. A lowercased copy of the text is kept for case-insensitive searching. The
+    compiled corpus is shared across sessions rather than copied on every rerun.
+
+    Only a summary of the vocab is kept: its size, its token count and a table of its top words, which is tabulated here
+    so that it is only sorted once per corpus rather than on every rerun. Each compiled corpus is also pickled to
+    CORPUS_CACHE_FOLDER under the modification time of its TSV and the library versions that pickled it, so after a
+    restart (or once evicted from memory) it is loaded back in one go instead of being parsed again.
 
     Args:
         source: the name of the dataset (determined by user selection)
         resolved_texts: a Boolean for whether to load original or coreference-resolved texts (default False)
     """
-    corpus_data = [] # initialise the corpus
-    vocab = Counter() # initialise a vocab count
-    punctuation = re.compile(r'[,;!/:\(\)\.\?"\[\]]') # define punctuation to enable accurate vocab count
+    source_path = os.path.join(DATA_FOLDER, f"{source.replace(' ', '_')}.tsv")
+    # name the saved corpus after everything that determines its contents
+    corpus_name = f"{source.replace(' ', '_')}_{'resolved' if resolved_texts else 'original'}"
+    cache_name = "_".join([
+        corpus_name, str(os.stat(source_path).st_mtime_ns), f"v{CORPUS_CACHE_VERSION}", CORPUS_CACHE_LIBRARIES
+    ])
+    cache_path = os.path.join(CORPUS_CACHE_FOLDER, f"{cache_name}.pkl")
+    if os.path.exists(cache_path): # the TSV is unchanged since it was last compiled
+        try:
+            with open(cache_path, mode="rb") as f:
+                return pickle.load(f)
+        # a partly written or otherwise unreadable file is compiled again from the TSV instead
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as error:
+            logger.warning("Could not load saved corpus %s, compiling it again: %s", cache_path, error)
+
+    texts = [] # initialise the corpus texts
+    scores = [] # initialise the corpus complexity scores
 
-    with open(os.path.join(DATA_FOLDER, f"{source.replace(' ', '_')}.tsv"), encoding="utf-8") as f:
+    with open(source_path, encoding="utf-8") as f:
+        if hasattr(os, "posix_fadvise"): # not available on Windows or macOS
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL) # the file is read once from start to end
         next(f) # skip the TSV header
         for line in f:
-            line = line.split("\t")
-            original_text = line[0]
-            resolved_text = line[1]
-            score = line[2]
-            if resolved_texts: # load only one of original or resolved text to preserve memory
-                corpus_data.append({"text":resolved_text, "score":float(score)})
-                for word in re.sub(punctuation, "", resolved_text).split():
-                    if word.isalpha():
-                        vocab[word.lower()] += 1
-            else:
-                corpus_data.append({"text":original_text, "score":float(score)})
-                for word in re.sub(punctuation, "", original_text).split():
-                    if word.isalpha():
-                        vocab[word.lower()] += 1
+            original_text, resolved_text, score = line.split("\t")
+            # load only one of original or resolved text to preserve memory
+            texts.append(resolved_text if resolved_texts else original_text)
+            scores.append(float(score))
+
+    corpus_text = "\n".join(texts) # no query can match across a newline
+    # count the vocab in one pass over the whole corpus rather than text by text
+    vocab = Counter(map(str.lower, filter(str.isalpha, PUNCTUATION.sub("", corpus_text).split())))
+
+    vocab_summary = {"size": len(vocab), "token_count": sum(vocab.values()), "table": tabulate_vocab(vocab)}
+
+    # lowercase the corpus once so that searches need no case folding, unless lowercasing changes its length (as "İ"
+    # would without LOWERCASE_FIXES), in which case match offsets would no longer line up with the original text
+    lowercase_text = corpus_text.translate(LOWERCASE_FIXES).lower()
+    if len(lowercase_text) != len(corpus_text):
+        lowercase_text = None
+
+    corpus = {
+        "text": corpus_text,
+        "lowercase_text": lowercase_text,
+        # numbers are kept in typed arrays of machine values rather than lists of int and float objects
+        "offsets": array("q", [0, *accumulate(len(text) + 1 for text in texts)]), # +1 for each newline
+        "scores": array("d", scores)
+    }
+
+    save_corpus((corpus, vocab_summary), cache_path, f"{escape(corpus_name)}_*.pkl")
+
+    return corpus, vocab_summary
+
+
+def save_corpus(compiled_corpus, cache_path, cache_pattern):
+    """
+    Pickle a compiled corpus to CORPUS_CACHE_FOLDER and delete any older saves of the same corpus.
+
+    Saving is only an optimisation, so if CORPUS_CACHE_FOLDER cannot be written to (e.g. DATA_FOLDER is read-only), the
+    error is logged and the corpus is simply compiled again next time.
+
+    Args:
+        compiled_corpus: the (corpus, vocab summary) tuple returned by compile_corpus
+        cache_path: the location to save the corpus to
+        cache_pattern: a glob pattern in CORPUS_CACHE_FOLDER for every save of the same source and text type
+    """
+    temp_path = f"{cache_path}.{os.getpid()}" # a concurrent session never loads a partial pickle
+    try:
+        os.makedirs(CORPUS_CACHE_FOLDER, exist_ok=True)
+        with open(temp_path, mode="wb") as f:
+            pickle.dump(compiled_corpus, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        logger.warning("Could not save compiled corpus %s: %s", cache_path, error)
+        try:
+            os.remove(temp_path)
+        except OSError: # e.g. it was never created
+            pass
+        return None
+
+    # saves from an earlier TSV modification time, CORPUS_CACHE_VERSION or library version are never loaded again
+    for stale_path in glob(os.path.join(escape(CORPUS_CACHE_FOLDER), cache_pattern)):
+        if stale_path != cache_path:
+            try:
+                os.remove(stale_path)
+            except OSError: # e.g. already deleted by another session
+                pass
+
+    return None
+
+
+@st.cache_resource(max_entries=QUERY_CACHE_SIZE)
+def compile_query(query, lowercase=False):
+    """
+    Compile a user search term into a RegEx that matches it as whole words in the joined corpus text.
+
+    Wildcards (*) are expanded to one or more WILDCARD characters and a leading ^ anchors the term to the start of a
+    text. Everything else is escaped, so it is matched literally. A run of n wildcards becomes a single repeat of at
+    least n characters, which matches the same but avoids the backtracking of trying every split between them. The
+    compiled pattern is kept across reruns, so it is only built again when the search term changes.
+
+    When the term starts with a literal word, the pattern leads with that literal and checks the word boundary before
+    it with a lookbehind. This is equivalent to a leading \\b but lets re search for the literal directly instead of
+    trying the pattern at every position in the corpus.
+
+    Args:
+        query: the search term entered by the user
+        lowercase: a Boolean for whether to lowercase the term and match it case-sensitively, for searching text that is
+            already lowercased (default False to match case-insensitively)
+    """
+    flags = re.MULTILINE if lowercase else re.IGNORECASE | re.MULTILINE
+    if lowercase:
+        query = query.translate(LOWERCASE_FIXES).lower()
+    anchor = "^" if query.startswith("^") else ""
+    pieces = re.split(r"(\*+)", query[len(anchor):]) # the text around each run of wildcards, then the runs
+    literals = [re.escape(literal) for literal in pieces[::2]]
+    wildcards = [WILDCARD + "+" if len(run) == 1 else WILDCARD + f"{{{len(run)},}}" for run in pieces[1::2]]
+    stem = literals[0] # the literal text before any wildcard
+    query = stem + "".join(wildcard + literal for wildcard, literal in zip(wildcards, literals[1:]))
+    if not anchor and re.match(r"\w", stem):
+        query = stem + r"(?<!\w" + stem + ")" + query[len(stem):] # lead with the literal stem
+        return re.compile(query + r"\b", flags=flags)
 
-    return corpus_data, vocab
+    return re.compile(r"\b" + anchor + query + r"\b", flags=flags)
 
 
-def find_matches(query, complexity_range, corpus):
+def find_matches(query, complexity_range, corpus, lowercase_query=None):
     """
     Find, count and return all matches for a RegEx in each text of the corpus and the subset of the corpus matching the complexity range.
+
+    The texts to display are returned as (styled, plain) pairs, so that downloads can use the plain text without having
+    to strip the HTML styling back out.
     
-    The RegEx should not contain groups (a constraint to allow the interface to be used by non-coders).
+    The RegEx should not contain groups (a constraint to allow the interface to be used by non-coders). It is run once
+    over the joined corpus text and each match is mapped back to its entry by offset, so it should be compiled with
+    re.MULTILINE for ^ to match at the start of every entry.
+
+    Where the corpus has a lowercased copy of its text, that is scanned with lowercase_query instead, which is faster
+    than case-insensitive matching. Each match is still read from the original text at the same offsets, so the matches
+    counted are the same as with query alone (e.g. "İstanbul" and "istanbul" are counted apart).
 
     Args:
-        query: a RegEx pattern
+        query: a compiled RegEx pattern
         complexity_range: a tuple of the min and max complexity values to filter by
-        corpus: a dict with keys "text" and "score"
+        corpus: a dict with the keys "text", "lowercase_text", "offsets" and "scores" (see compile_corpus)
+        lowercase_query: the same RegEx compiled to match lowercased text (default None to only use query)
     """
     dataset_matches = Counter() # initialise a count of entries in the whole dataset with ≥1 match
     in_range_matches = Counter() # initialise a count of entries in the complexity range with ≥1 match
-    display_texts = [] # initialise a list of matching entries to display (capped at MAX_RETURNS)
+    display_entries = [] # initialise a list of the indices of matching entries to display (capped at MAX_RETURNS)
 
-    for entry in corpus:
-        text = entry["text"] # set the text to search
-        score = entry["score"] # set the score of the text
+    # scan the whole corpus at once and group the matches by the entry they fall in
+    corpus_text = corpus["text"]
+    entry_offsets = corpus["offsets"]
+    if lowercase_query is not None and corpus["lowercase_text"] is not None:
+        scan = lowercase_query.finditer(corpus["lowercase_text"])
+    else:
+        scan = query.finditer(corpus_text)
+    # slice each match out of the original text, which has the same offsets as its lowercased copy
+    matches = ((bisect_right(entry_offsets, m.start()) - 1, corpus_text[m.start():m.end()]) for m in scan)
+    for entry_index, entry_matches in groupby(matches, key=itemgetter(0)):
+        score = corpus["scores"][entry_index] # set the score of the text
         in_range = score >= complexity_range[0] and score <= complexity_range[1] # Boolean for complexity range
-        match = re.findall(query, text) # search the text for matches
-        if match:
-            for m in set([m.lower() for m in match]): # add to whole dataset count
-                dataset_matches[m] += 1
-            if in_range:
-                for m in set([m.lower() for m in match]): # add to complexity range count
-                    in_range_matches[m] += 1
-            # filter the matches that are displayed by length cap and complexity
-            if len(display_texts) < MAX_RETURNS and in_range:
-                for m in set(match):
-                    # add HTML styling to matches in the original text
-                    text = re.sub(r"\b" + m + r"\b", '<font color="red"><b>' + m + "</b></font>", text)
-                display_texts.append(text.strip()) # add the styled entry to the match list
+        match = [m for _, m in entry_matches] # the matches in the text (at least one)
+        distinct_matches = set(map(str.lower, match)) # each distinct match counts once per entry
+        dataset_matches.update(distinct_matches) # add to whole dataset count
+        if in_range:
+            in_range_matches.update(distinct_matches) # add to complexity range count
+        # filter the matches that are displayed by length cap and complexity
+        if len(display_entries) < MAX_RETURNS and in_range:
+            display_entries.append(entry_index)
+
+    # only once counting is done, slice out the entries to display and pair each with an HTML-styled copy
+    display_texts = [
+        (query.sub(HIGHLIGHT, text), text)
+        for text in (corpus_text[entry_offsets[i]:entry_offsets[i + 1] - 1].strip() for i in display_entries)
+    ]
 
     return dataset_matches, in_range_matches, display_texts
 
 
+def format_percentages(counts, total):
+    """
+    Convert counts to percentages of a total rounded to 2 decimal places, with "<0.01" for any that round to 0.
+
+    The arithmetic is done on the whole column at once and gives the same values as Python's round() on each count.
+
+    Args:
+        counts: a pandas Series of counts
+        total: the count that is 100%
+    """
+    percentages = (100*(counts/total)).round(2)
+
+    return percentages.astype(object).mask(percentages == 0, "<0.01")
+
+
+@st.cache_data(max_entries=SEARCH_CACHE_SIZE)
+def search_corpus(source, resolved_texts, query, complexity_range):
+    """
+    Search a corpus for a user search term and return the match counts and display texts from find_matches.
+
+    The results are cached by their arguments, so reruns that leave the search unchanged (e.g. switching tabs or setting
+    download options) reuse them instead of scanning the corpus again. If any literal part of the term (the text around
+    its wildcards) does not occur anywhere in the lowercased corpus, there can be no matches, so the RegEx is not run.
+
+    Args:
+        source: the name of the dataset (determined by user selection)
+        resolved_texts: a Boolean for whether to search original or coreference-resolved texts
+        query: the search term entered by the user
+        complexity_range: a tuple of the min and max complexity values to filter by
+    """
+    corpus = compile_corpus(source, resolved_texts=resolved_texts)[0]
+    if corpus["lowercase_text"] is not None:
+        literals = query.translate(LOWERCASE_FIXES).lower().removeprefix("^").split("*")
+        if not all(literal in corpus["lowercase_text"] for literal in literals): # a quick substring search
+            return Counter(), Counter(), []
+
+    query_re = compile_query(query)
+    lowercase_query_re = compile_query(query, lowercase=True)
+
+    return find_matches(query_re, complexity_range, corpus, lowercase_query=lowercase_query_re)
+
+
+def tabulate_matches(matches, corpus_entry_count):
+    """
+    Tabulate match statistics for display, sorted by the number of entries containing each match.
+
+    Only the top MAX_STATS matches are picked out (with a heap rather than a full sort) and tabulated, but percentages are
+    still of all matches.
+
+    Args:
+        matches: a Counter of the number of entries each match appears in (from find_matches)
+        corpus_entry_count: the number of entries in the whole corpus
+    """
+    top_matches = nlargest(MAX_STATS, matches.items(), key=itemgetter(1, 0)) # by entries then match, descending
+    entry_counts = pd.Series([count for _, count in top_matches]) # reuse the counts for every column
+    stats_table = pd.DataFrame({ # convert string match data to table
+        "match": [match for match, _ in top_matches],
+        "%": format_percentages(entry_counts, sum(matches.values())).astype(str),
+        "entries": entry_counts,
+        "% of source": format_percentages(entry_counts, corpus_entry_count).astype(str)
+    })
+    stats_table.index += 1 # set row index to start from 1 instead of 0
+
+    return stats_table
+
+
+def tabulate_results(display_texts):
+    """
+    Lay out the styled texts of a search as a numbered HTML table for display.
+
+    The table is the same as a single-column DataFrame.to_html (without header or escaping) would give, but built with
+    a single join rather than by pandas row by row.
+
+    Args:
+        display_texts: a list of (styled, plain) entry text pairs (from find_matches)
+    """
+    rows = "".join(
+        f"    <tr>\n      <td>{i}</td>\n      <td>{text}</td>\n    </tr>\n"
+        for i, (text, _) in enumerate(display_texts, start=1) # number rows from 1 instead of 0
+    )
+
+    return f'<table border="1" class="dataframe">\n  <tbody>\n{rows}  </tbody>\n</table>'
+
+
+def tabulate_vocab(vocab):
+    """
+    Tabulate the most frequent words in a corpus for display, sorted by count.
+
+    Only the top MAX_VOCAB words are picked out of the vocab (with a heap rather than a full sort) and tabulated.
+
+    Args:
+        vocab: a Counter of the number of times each word appears in the corpus (from compile_corpus)
+    """
+    top_vocab = nlargest(MAX_VOCAB, vocab.items(), key=itemgetter(1, 0)) # by count then word, like a descending sort
+    counts = pd.Series([count for _, count in top_vocab])
+    vocab_table = pd.DataFrame({ # convert string match data to table
+        "word": [word for word, _ in top_vocab],
+        "count": counts,
+        "% in source": format_percentages(counts, sum(vocab.values()))
+    })
+    vocab_table.index += 1 # set row index to start from 1 instead of 0
+
+    return vocab_table
+
+
+@st.cache_data(ttl=SOURCE_LIST_TTL)
+def list_sources():
+    """
+    List the names of the corpus sources in DATA_FOLDER, derived from the filenames of its TSV files.
+
+    The list is cached for SOURCE_LIST_TTL seconds rather than read from the folder on every rerun, so a source added to
+    or removed from DATA_FOLDER shows up in the options within that time without restarting the app.
+    """
+    return sorted([f.replace(".tsv", "").replace("_", " ") for f in os.listdir(DATA_FOLDER) if f.endswith(".tsv")])
+
+
 def create_download():
     """
     Change the app session state to mark that a translation data file is ready for download.
@@ -106,9 +377,7 @@ def reset_download():
 st.set_page_config(page_title="Corpora", layout="wide") # browser tab title and page layout; must be first st call
 if "download" not in st.session_state: # initialise state of translation data download file
     st.session_state["download"] = False
-corpus_names = sorted( # create corpus source options for the user based on filenames in DATA_FOLDER
-    [f.replace(".tsv", "").replace("_", " ") for f in os.listdir(DATA_FOLDER) if f.endswith(".tsv")]
-)
+corpus_names = list_sources() # create corpus source options for the user based on filenames in DATA_FOLDER
 parameters, results, statistics = st.columns(spec=[0.2, 0.525, 0.275], gap="large") # columns with widths and gap size
 
 # SEARCH PARAMETERS
@@ -128,10 +397,10 @@ with parameters:
     resolve_corefs = st.toggle("Resolve coreferences", on_change=reset_download)
 
     # COMPILE ON USER SELECTION
-    corpus_data, corpus_vocab = compile_corpus(source, resolved_texts=resolve_corefs)
-    corpus_entry_count = len(corpus_data)
-    corpus_vocab_size = len(corpus_vocab)
-    corpus_token_count = sum(corpus_vocab.values())
+    corpus, corpus_vocab = compile_corpus(source, resolved_texts=resolve_corefs)
+    corpus_entry_count = len(corpus["scores"])
+    corpus_vocab_size = corpus_vocab["size"]
+    corpus_token_count = corpus_vocab["token_count"]
 
 # DISPLAYED RESULTS PREAMBLE
 with results:
@@ -158,13 +427,7 @@ with corpus_stats:
     st.image(f"data/images/{source.replace(' ', '_')}_complexity.png")
     st.markdown("**Top Vocab**:")
     # CORPUS VOCABULARY TABLE
-    vocab_table = pd.DataFrame({ # convert string match data to table
-        "word": corpus_vocab.keys(),
-        "count": corpus_vocab.values(),
-        "% in source": [round(100*(value/corpus_token_count), 2) or "<0.01" for value in corpus_vocab.values()]
-    }).sort_values(by=["count", "word"], ascending=False).reset_index(drop=True)
-    vocab_table.index += 1 # set row index to start from 1 instead of 0
-    st.dataframe(vocab_table[:1000], use_container_width=True)
+    st.dataframe(corpus_vocab["table"], use_container_width=True)
     # DATA NOTICES
     if source == "Spoken English":
         st.caption(
@@ -177,7 +440,7 @@ with corpus_stats:
 # SEARCH EXECUTION
 if query != "":
     # SEARCH TERM PROHIBITIONS
-    if re.search(r'[\\\(\)\[\]\?\$\+]', query):
+    if PROHIBITED_CHARACTERS.search(query):
         with results:
             st.markdown(
                 """
@@ -199,9 +462,7 @@ if query != "":
     # LEGITIMATE SEARCH
     else:
         # PREPARE AND PERFORM SEARCH
-        query = query.replace("*", "[\w\",'\-\<\+“”\.\\\\/:]+").replace(".", "\.")
-        query_re = re.compile(r"\b" + query + r"\b", flags=re.IGNORECASE)
-        dataset_matches, in_range_matches, entry_texts = find_matches(query_re, complexity_range, corpus_data)
+        dataset_matches, in_range_matches, entry_texts = search_corpus(source, resolve_corefs, query, complexity_range)
         match_count = sum(dataset_matches.values())
         in_range_match_count = sum(in_range_matches.values())
 
@@ -224,41 +485,25 @@ if query != "":
                 # RESULTS TABLE
                 results_table_container = st.container(height=500, border=False) # place results in fixed-height box
                 with results_table_container.container():
-                    results_table = pd.DataFrame({"": entry_texts}) # convert search results to table
-                    results_table.index += 1 # set row index to start from 1 instead of 0
-                    st.markdown( # convert pd table to HTML to allow text highlighting
-                        results_table.to_html(escape=False, header=False, bold_rows=False), unsafe_allow_html=True
-                    )
+                    # HTML table to allow text highlighting
+                    st.markdown(tabulate_results(entry_texts), unsafe_allow_html=True)
 
         # DISPLAY SEARCH STATISTICS
         with search_stats:
             if dataset_matches:
                 st.markdown(f"**Results in whole dataset** ({match_count:,})")
                 # WHOLE DATASET STATS
-                stats_table = pd.DataFrame({ # convert string match data to table
-                    "match": dataset_matches.keys(),
-                    "%": [str(round(100*(value/match_count), 2) or "<0.01") for value in dataset_matches.values()],
-                    "entries": dataset_matches.values(),
-                    "% of source": [
-                        str(round(100*(value/corpus_entry_count), 2) or "<0.01") for value in dataset_matches.values()
-                    ]
-                }).sort_values(by=["entries", "match"], ascending=False).reset_index(drop=True)
-                stats_table.index += 1 # set row index to start from 1 instead of 0
+                stats_table = tabulate_matches(dataset_matches, corpus_entry_count)
                 st.dataframe(stats_table, use_container_width=True, hide_index=True)
+                if len(dataset_matches) > MAX_STATS:
+                    st.caption(f"Showing the top {MAX_STATS:,} of {len(dataset_matches):,} distinct matches")
 
                 st.markdown(f"**Results in complexity range** ({in_range_match_count:,})")
                 # COMPLEXITY RANGE STATS
-                stats_table = pd.DataFrame({ # convert string match data to table
-                    "match": in_range_matches.keys(),
-                    "%": [
-                        str(round(100*(value/in_range_match_count), 2) or "<0.01")
-                        for value in in_range_matches.values()
-                    ],
-                    "entries": in_range_matches.values(),
-                    "% of source": [str(round(100*(value/corpus_entry_count), 2) or "<0.01") for value in in_range_matches.values()]
-                }).sort_values(by=["entries", "match"], ascending=False).reset_index(drop=True)
-                stats_table.index += 1 # set row index to start from 1 instead of 0
+                stats_table = tabulate_matches(in_range_matches, corpus_entry_count)
                 st.dataframe(stats_table, use_container_width=True, hide_index=True)
+                if len(in_range_matches) > MAX_STATS:
+                    st.caption(f"Showing the top {MAX_STATS:,} of {len(in_range_matches):,} distinct matches")
                 # DATA NOTICES
                 if source == "Spoken English":
                     st.caption(
@@ -293,23 +538,20 @@ if query != "":
                 else:
                     filename = f"{source.replace(' ', '_')}_data_{date.today()}.csv"
                     csv_header = ["id", "NL", "UL", "Translation Level", "Ticket Status", "Assignee", "Reviewer", "Tags", "Comment"]
-                    with open(os.path.join(DATA_FOLDER, "download_data.csv"), mode="w") as f:
-                        writer = csv.writer(f)
-                        writer.writerow(csv_header)
-                        for text in entry_texts[:download_quantity]:
-                            text = text.replace('<font color="red"><b>', "")
-                            text = text.replace('</b></font>', "")
-                            if single_sentences:
-                                sentences = sent_tokenize(text)
-                                for sentence in sentences:
-                                    writer.writerow(["", sentence, "", "", "NOT_STARTED", "", "", tags, ""])
-                            else:
-                                writer.writerow(["", text, "", "", "NOT_STARTED", "", "", tags, ""])
-                    with open(os.path.join(DATA_FOLDER, "download_data.csv"), mode="rb") as f:
-                        data_download_button = st.download_button(
-                            label="Download file",
-                            data=f,
-                            file_name=filename,
-                            mime="text/csv",
-                            type="primary"
-                        )
+                    csv_data = io.StringIO() # build the file in memory rather than on disk
+                    writer = csv.writer(csv_data)
+                    writer.writerow(csv_header)
+                    for _, text in entry_texts[:download_quantity]: # the plain texts, without HTML styling
+                        if single_sentences:
+                            sentences = sent_tokenize(text)
+                            for sentence in sentences:
+                                writer.writerow(["", sentence, "", "", "NOT_STARTED", "", "", tags, ""])
+                        else:
+                            writer.writerow(["", text, "", "", "NOT_STARTED", "", "", tags, ""])
+                    data_download_button = st.download_button(
+                        label="Download file",
+                        data=csv_data.getvalue().encode(),
+                        file_name=filename,
+                        mime="text/csv",
+                        type="primary"
+                    )